@@ -2,8 +2,9 @@
 
 from network_manager import NetworkManager
 from message import Message
-import threading
-import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple, Union
+import itertools
 import logging
 
 class Client:
@@ -11,107 +12,134 @@ class Client:
         self.client_id = client_id
         self.connected_server_id = connected_server_id
         self.network_manager = network_manager
-        self.message_queue = []
-        self.lock = threading.Lock()
-        threading.Thread(target=self.process_responses, daemon=True, name=f"{self.client_id}_response_processor").start()
+        self._request_ids = itertools.count(1)
+        self._pending: Dict[int, Future] = {}  # request_id -> response future
+        # Responses are pushed to us from the network's dispatch pool
+        self.network_manager.register_listener(self.client_id, self.process_response)
 
-    def send_request(self, message):
+    def send_request(self, message) -> Tuple[int, Future]:
+        request_id = next(self._request_ids)
+        message.data['request_id'] = request_id
+        future = Future()
+        self._pending[request_id] = future
         self.network_manager.send_message(message, self.connected_server_id)
+        return request_id, future
 
-    def receive_response(self):
-        with self.lock:
-            if self.message_queue:
-                return self.message_queue.pop(0)
-            else:
-                return None
+    def process_response(self, message):
+        request_id = message.data.get('request_id')
+        future = self._pending.pop(request_id, None)
+        if future is None:
+            # Its request already timed out, or the id was never ours
+            logging.warning(f"Client '{self.client_id}' received '{message.type}' for late or unknown request_id {request_id}")
+            message.release()
+            return
+        logging.debug(f"Client '{self.client_id}' received message of type '{message.type}'")
+        future.set_result(message)
 
-    def process_responses(self):
-        while True:
-            message = self.network_manager.receive_message(self.client_id)
-            if message:
-                with self.lock:
-                    self.message_queue.append(message)
-                    logging.debug(f"Client '{self.client_id}' received message of type '{message.type}'")
-            else:
-                time.sleep(0.1)
+    def _await_response(self, message, expected_type: str, timeout: float = 5) -> Optional[dict]:
+        # Send the request and block until its response arrives; returns the response data
+        request_id, future = self.send_request(message)
+        try:
+            response = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self._pending.pop(request_id, None)
+            return None
+        data = response.data
+        if response.type != expected_type:
+            logging.warning(f"Client '{self.client_id}' received unexpected message type '{response.type}'")
+            data = None
+        response.release()
+        return data
 
-    def create_file(self, filename: str):
-        message = Message('create_file', {
+    def create_file(self, filename: str) -> bool:
+        response = self._await_response(Message.acquire('create_file', {
             'filename': filename,
             'client_id': self.client_id
-        })
-        self.send_request(message)
-        # Wait for response
-        start_time = time.time()
-        while time.time() - start_time < 5:
-            response = self.receive_response()
-            if response:
-                if response.type == 'create_file_response':
-                    success = response.data['success']
-                    print(f"Client '{self.client_id}' create file {'succeeded' if success else 'failed'}.")
-                    return
-                else:
-                    logging.warning(f"Client '{self.client_id}' received unexpected message type '{response.type}'")
-            time.sleep(0.1)
-        print(f"Client '{self.client_id}' did not receive a response for creating file '{filename}'.")
+        }), 'create_file_response')
+        if response is None:
+            logging.warning(f"Client '{self.client_id}' did not receive a response for creating file '{filename}'.")
+            return False
+        logging.info(f"Client '{self.client_id}' create file {'succeeded' if response['success'] else 'failed'}.")
+        return response['success']
 
-    def read_file(self, filename: str):
-        message = Message('read_file', {
+    def read_file(self, filename: str) -> Optional[Union[str, bytes]]:
+        response = self._await_response(Message.acquire('read_file', {
             'filename': filename,
             'client_id': self.client_id
-        })
-        self.send_request(message)
-        # Wait for response
-        start_time = time.time()
-        while time.time() - start_time < 5:
-            response = self.receive_response()
-            if response:
-                if response.type == 'read_file_response':
-                    content = response.data['content']
-                    print(f"Client '{self.client_id}' read file '{filename}': {content}")
-                    return
-                else:
-                    logging.warning(f"Client '{self.client_id}' received unexpected message type '{response.type}'")
-            time.sleep(0.1)
-        print(f"Client '{self.client_id}' did not receive a response for reading file '{filename}'.")
+        }), 'read_file_response')
+        if response is None:
+            logging.warning(f"Client '{self.client_id}' did not receive a response for reading file '{filename}'.")
+            return None
+        logging.info(f"Client '{self.client_id}' read file '{filename}': {response['content']}")
+        return response['content']
 
-    def write_file(self, filename: str, content: str):
-        message = Message('write_file', {
+    def write_file(self, filename: str, content: Union[str, bytes]) -> bool:
+        response = self._await_response(Message.acquire('write_file', {
             'filename': filename,
             'content': content,
             'client_id': self.client_id
-        })
-        self.send_request(message)
-        # Wait for response
-        start_time = time.time()
-        while time.time() - start_time < 5:
-            response = self.receive_response()
-            if response:
-                if response.type == 'write_file_response':
-                    success = response.data['success']
-                    print(f"Client '{self.client_id}' write to file '{filename}' {'succeeded' if success else 'failed'}.")
-                    return
-                else:
-                    logging.warning(f"Client '{self.client_id}' received unexpected message type '{response.type}'")
-            time.sleep(0.1)
-        print(f"Client '{self.client_id}' did not receive a response for writing to file '{filename}'.")
+        }), 'write_file_response')
+        if response is None:
+            logging.warning(f"Client '{self.client_id}' did not receive a response for writing to file '{filename}'.")
+            return False
+        logging.info(f"Client '{self.client_id}' write to file '{filename}' {'succeeded' if response['success'] else 'failed'}.")
+        return response['success']
 
-    def delete_file(self, filename: str):
-        message = Message('delete_file', {
+    def delete_file(self, filename: str) -> bool:
+        response = self._await_response(Message.acquire('delete_file', {
             'filename': filename,
             'client_id': self.client_id
-        })
-        self.send_request(message)
-        # Wait for response
-        start_time = time.time()
-        while time.time() - start_time < 5:
-            response = self.receive_response()
-            if response:
-                if response.type == 'delete_file_response':
-                    success = response.data['success']
-                    print(f"Client '{self.client_id}' delete file '{filename}' {'succeeded' if success else 'failed'}.")
-                    return
-                else:
-                    logging.warning(f"Client '{self.client_id}' received unexpected message type '{response.type}'")
-            time.sleep(0.1)
-        print(f"Client '{self.client_id}' did not receive a response for deleting file '{filename}'.")
+        }), 'delete_file_response')
+        if response is None:
+            logging.warning(f"Client '{self.client_id}' did not receive a response for deleting file '{filename}'.")
+            return False
+        logging.info(f"Client '{self.client_id}' delete file '{filename}' {'succeeded' if response['success'] else 'failed'}.")
+        return response['success']
+
+    def create_files(self, filenames: List[str]) -> Optional[List[bool]]:
+        response = self._await_response(Message.acquire('create_file_batch', {
+            'filenames': filenames,
+            'client_id': self.client_id
+        }), 'create_file_batch_response')
+        if response is None:
+            logging.warning(f"Client '{self.client_id}' did not receive a response for creating {len(filenames)} files.")
+            return None
+        for filename, success in zip(filenames, response['results']):
+            logging.info(f"Client '{self.client_id}' create file '{filename}' {'succeeded' if success else 'failed'}.")
+        return response['results']
+
+    def read_files(self, filenames: List[str]) -> Optional[List[Optional[Union[str, bytes]]]]:
+        response = self._await_response(Message.acquire('read_file_batch', {
+            'filenames': filenames,
+            'client_id': self.client_id
+        }), 'read_file_batch_response')
+        if response is None:
+            logging.warning(f"Client '{self.client_id}' did not receive a response for reading {len(filenames)} files.")
+            return None
+        for filename, content in zip(filenames, response['results']):
+            logging.info(f"Client '{self.client_id}' read file '{filename}': {content}")
+        return response['results']
+
+    def write_files(self, files: Dict[str, Union[str, bytes]]) -> Optional[List[bool]]:
+        response = self._await_response(Message.acquire('write_file_batch', {
+            'files': files,
+            'client_id': self.client_id
+        }), 'write_file_batch_response')
+        if response is None:
+            logging.warning(f"Client '{self.client_id}' did not receive a response for writing to {len(files)} files.")
+            return None
+        for filename, success in zip(files, response['results']):
+            logging.info(f"Client '{self.client_id}' write to file '{filename}' {'succeeded' if success else 'failed'}.")
+        return response['results']
+
+    def delete_files(self, filenames: List[str]) -> Optional[List[bool]]:
+        response = self._await_response(Message.acquire('delete_file_batch', {
+            'filenames': filenames,
+            'client_id': self.client_id
+        }), 'delete_file_batch_response')
+        if response is None:
+            logging.warning(f"Client '{self.client_id}' did not receive a response for deleting {len(filenames)} files.")
+            return None
+        for filename, success in zip(filenames, response['results']):
+            logging.info(f"Client '{self.client_id}' delete file '{filename}' {'succeeded' if success else 'failed'}.")
+        return response['results']
@@ -1,10 +1,17 @@
 # file.py
 
-from typing import List
+from array import array
+from bisect import bisect_right
+from typing import List, Tuple, Union
 import time
 
+# Versions kept per file; older ones are dropped at checkpoints
+MAX_VERSION_HISTORY = 32
+
 class FileVersion:
-    def __init__(self, content: str, timestamp: float, version: int):
+    __slots__ = ('content', 'timestamp', 'version')
+
+    def __init__(self, content: Union[str, bytes], timestamp: float, version: int):
         self.content = content
         self.timestamp = timestamp
         self.version = version
@@ -13,24 +20,55 @@ class File:
     def __init__(self, filename: str, owner_server_id: str):
         self.filename = filename
         self.owner_server_id = owner_server_id
-        self.versions: List[FileVersion] = []
+        # Version history stored column-wise: one entry per version in each
+        self.contents: List[Union[str, bytes]] = []  # Content is kept as given, never re-encoded
+        self.timestamps = array('d')
+        self.version_nums = array('i')
+        self.total_versions = 0
+        self.checkpoint_version = 0  # Versions up to this number have been dropped
         self.lease = None  # Lease object
 
-    def add_version(self, content: str):
-        version_number = len(self.versions) + 1
-        new_version = FileVersion(content, time.time(), version_number)
-        self.versions.append(new_version)
+    def add_version(self, content: Union[str, bytes]):
+        self.total_versions += 1
+        self.contents.append(content)
+        self.timestamps.append(time.time())
+        self.version_nums.append(self.total_versions)
+        # Let the history overshoot so trimming stays amortized O(1) per write
+        if len(self.contents) >= 2 * MAX_VERSION_HISTORY:
+            self.checkpoint()
+
+    def checkpoint(self):
+        drop = len(self.contents) - MAX_VERSION_HISTORY
+        if drop > 0:
+            del self.contents[:drop]
+            del self.timestamps[:drop]
+            del self.version_nums[:drop]
+            self.checkpoint_version = self.version_nums[0] - 1
 
     def get_latest_version(self) -> FileVersion:
-        if self.versions:
-            return self.versions[-1]
+        if self.contents:
+            return FileVersion(self.contents[-1], self.timestamps[-1], self.version_nums[-1])
         else:
             return None
 
+    def get_version_at(self, timestamp: float) -> FileVersion:
+        # Newest version written at or before timestamp; timestamps are appended
+        # in order, so the search is a C-level bisect over the float column
+        i = bisect_right(self.timestamps, timestamp)
+        if i:
+            return FileVersion(self.contents[i - 1], self.timestamps[i - 1], self.version_nums[i - 1])
+        else:
+            return None
+
+    def get_versions(self) -> List[Tuple[str, float, int]]:
+        # (content, timestamp, version) rows, oldest first
+        return list(zip(self.contents, self.timestamps, self.version_nums))
+
 class Lease:
     def __init__(self, lessee: str, expiry_time: float):
         self.lessee = lessee
         self.expiry_time = expiry_time
 
     def is_expired(self) -> bool:
-        return time.time() > self.expiry_time
+        # expiry_time is on the time.monotonic() clock
+        return time.monotonic() > self.expiry_time
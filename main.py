@@ -3,12 +3,17 @@
 import time
 import random
 from file_server import FileServer
+from raft_node import STOPPED, LEADER
 from client import Client
 from network_manager import NetworkManager
 import logging
+import logging.handlers
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s')
+    # Buffer log records and write them out in batches rather than one write per record
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'))
+    logging.basicConfig(level=logging.DEBUG, handlers=[logging.handlers.MemoryHandler(capacity=1024, target=stream_handler)])
 
     network_manager = NetworkManager()
 
@@ -98,7 +103,7 @@ if __name__ == "__main__":
     # Simulate leader failure
     print(f"\nSimulating failure of leader '{leader_id}'...")
     # Stop the leader's threads (simplified for this example)
-    leader_server.state = 'stopped'
+    leader_server.state = STOPPED
     print(f"Server '{leader_id}' has been stopped.")
 
     # Allow time for new leader election
@@ -107,7 +112,7 @@ if __name__ == "__main__":
     # Check for new leader
     new_leader_id = None
     for server_id, server in servers.items():
-        if server.state == 'leader' and server_id != leader_id:
+        if server.state == LEADER and server_id != leader_id:
             new_leader_id = server_id
             print(f"New leader elected: {new_leader_id}")
             break
@@ -1,4 +1,69 @@
+import threading
+from collections import deque
+
+# Free messages kept per thread before spilling into the shared pool
+LOCAL_POOL_SIZE = 32
+SHARED_POOL_SIZE = 1024
+
+class _MessagePool:
+    def __init__(self):
+        self._local = threading.local()
+        self._shared = deque()
+        self._lock = threading.Lock()
+
+    def _free_list(self) -> list:
+        free = getattr(self._local, 'free', None)
+        if free is None:
+            free = self._local.free = []
+        return free
+
+    def get(self):
+        free = self._free_list()
+        if free:
+            return free.pop()
+        # Messages are usually released on a different thread than they are acquired on
+        with self._lock:
+            if self._shared:
+                return self._shared.pop()
+        return None
+
+    def put(self, message):
+        free = self._free_list()
+        if len(free) < LOCAL_POOL_SIZE:
+            free.append(message)
+            return
+        with self._lock:
+            if len(self._shared) < SHARED_POOL_SIZE:
+                self._shared.append(message)
+
 class Message:
+    __slots__ = ('type', 'data', '_pool')
+
     def __init__(self, msg_type: str, data: dict):
         self.type = msg_type
-        self.data = data
\ No newline at end of file
+        self.data = data
+        self._pool = None
+
+    @classmethod
+    def acquire(cls, msg_type: str, data: dict) -> 'Message':
+        message = _pool.get()
+        if message is None:
+            message = cls(msg_type, data)
+        else:
+            message.type = msg_type
+            message.data = data
+        message._pool = _pool
+        return message
+
+    def release(self):
+        # No-op for messages built directly or already released. Only the Message
+        # shell is recycled: its data dict is dropped, not pooled, because the
+        # consumer (e.g. a client Future's caller) may still hold and read it.
+        pool = self._pool
+        if pool is not None:
+            self._pool = None
+            self.type = ''
+            self.data = None
+            pool.put(self)
+
+_pool = _MessagePool()
@@ -1,30 +1,76 @@
 # network_manager.py
 
+import os
+import queue
 import threading
-from typing import Callable, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Tuple
 import logging
 
 class NetworkManager:
     def __init__(self):
-        self.handlers: Dict[str, Callable] = {}
-        self.message_queues: Dict[str, list] = {}
-        self.lock = threading.Lock()
+        self.direct_handlers: Dict[Tuple[str, str], Callable] = {}
+        self.listeners: Dict[str, Callable] = {}
+        self._executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="network_dispatch")
+        self.mailboxes: Dict[str, queue.SimpleQueue] = {}
+        self._create_lock = threading.Lock()  # Only guards mailbox creation
 
-    def register_handler(self, msg_type: str, handler: Callable):
-        self.handlers[msg_type] = handler
+    def register_direct(self, recipient_id: str, msg_type: str, handler: Callable):
+        # Messages of this type sent to recipient_id skip its mailbox and are
+        # handed straight to the handler on the shared dispatch pool
+        self.direct_handlers[(recipient_id, msg_type)] = handler
+
+    def register_listener(self, recipient_id: str, handler: Callable):
+        # Every other message for recipient_id is passed whole to handler(message)
+        # on the dispatch pool; the handler takes ownership of the message
+        self.listeners[recipient_id] = handler
+
+    def _get_mbox(self, recipient_id) -> queue.SimpleQueue:
+        mbox = self.mailboxes.get(recipient_id)
+        if mbox is None:
+            with self._create_lock:
+                mbox = self.mailboxes.setdefault(recipient_id, queue.SimpleQueue())
+        return mbox
+
+    def _run_direct(self, handler: Callable, message, recipient_id):
+        try:
+            handler(message.data)
+        except Exception as e:
+            logging.error(f"Error dispatching '{message.type}' to '{recipient_id}': {e}")
+        finally:
+            message.release()
+
+    def _run_listener(self, handler: Callable, message, recipient_id):
+        try:
+            handler(message)
+        except Exception as e:
+            logging.error(f"Error delivering '{message.type}' to '{recipient_id}': {e}")
 
     def send_message(self, message, recipient_id):
-        with self.lock:
-            if recipient_id not in self.message_queues:
-                self.message_queues[recipient_id] = []
-            self.message_queues[recipient_id].append(message)
-            logging.debug(f"Message of type '{message.type}' sent to '{recipient_id}'")
-
-    def receive_message(self, server_id):
-        with self.lock:
-            if server_id in self.message_queues and self.message_queues[server_id]:
-                message = self.message_queues[server_id].pop(0)
-                logging.debug(f"Server '{server_id}' received message of type '{message.type}'")
-                return message
-            else:
-                return None
+        handler = self.direct_handlers.get((recipient_id, message.type))
+        if handler:
+            self._executor.submit(self._run_direct, handler, message, recipient_id)
+            logging.debug(f"Message of type '{message.type}' dispatched to '{recipient_id}'")
+            return
+        listener = self.listeners.get(recipient_id)
+        if listener:
+            self._executor.submit(self._run_listener, listener, message, recipient_id)
+            logging.debug(f"Message of type '{message.type}' delivered to '{recipient_id}'")
+            return
+        self._get_mbox(recipient_id).put_nowait(message)
+        logging.debug(f"Message of type '{message.type}' sent to '{recipient_id}'")
+
+    def send_batch(self, message, recipient_ids):
+        # The same message object goes to every recipient, so it must be read-only
+        # for handlers and must not come from the Message pool
+        for recipient_id in recipient_ids:
+            self.send_message(message, recipient_id)
+
+    def receive_message(self, server_id, block=False, timeout=None):
+        # With block=True, waits on the mailbox until a message arrives or timeout expires
+        try:
+            message = self._get_mbox(server_id).get(block=block, timeout=timeout)
+        except queue.Empty:
+            return None
+        logging.debug(f"Server '{server_id}' received message of type '{message.type}'")
+        return message
@@ -1,193 +1,571 @@
 # raft_node.py
 
+import queue
 import threading
+from array import array
 import time
 import random
-from typing import List
+from typing import List, Tuple
 from network_manager import NetworkManager
 from message import Message
 import logging
 
+# Node roles held in RaftNode.state
+STOPPED, FOLLOWER, CANDIDATE, LEADER = range(4)
+
+# Default bounds of the randomized election timeout, in seconds (Raft paper's 150-300 ms)
+ELECTION_TIMEOUT_RANGE = (0.15, 0.3)
+# Default seconds between AppendEntries to each follower when there is nothing to replicate
+HEARTBEAT_INTERVAL = 0.05
+# Maximum number of AppendEntries requests applied to the log per batch
+APPEND_BATCH_SIZE = 64
+# Maximum number of mailbox messages handled per process_messages wakeup
+MAX_BATCH = 64
+
 class RaftNode:
-    def __init__(self, server_id: str, network_manager: NetworkManager, peers: List[str]):
+    def __init__(self, server_id: str, network_manager: NetworkManager, peers: List[str],
+                 election_timeout_range: Tuple[float, float] = ELECTION_TIMEOUT_RANGE,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL):
         self.server_id = server_id
         self.network_manager = network_manager
         self.peers = peers  # List of other server IDs
-        self.state = 'follower'
+        self._peer_count = len(peers)
+        self._majority = (self._peer_count + 1) // 2 + 1  # Votes needed, counting our own
+        self.state = FOLLOWER
         self.current_term = 0
         self.voted_for = None
         self.commit_index = 0
         self.last_applied = 0
         self.next_index = {peer: 0 for peer in self.peers}
         self.match_index = {peer: 0 for peer in self.peers}
-        self.log = []  # List of log entries
-        self.lock = threading.Lock()
-        self.election_timeout = random.uniform(1, 2)  # Adjusted timeout
-        self.last_heartbeat = time.time()
+        # The log is kept as parallel columns: each entry's term and its operation
+        self.log_terms = array('q')
+        self.log = []
+        self._log_generation = 0  # Bumped on every log change, under _log_lock
+        # Cached len(self.log) and term of the last entry, kept in step with the log
+        self._last_log_index = 0
+        self._last_log_term = 0
+        # Term/vote/role state, the log, and per-peer progress are guarded separately.
+        # Lock order: _term_lock before _log_lock; _peer_lock is never held with either.
+        self._term_lock = threading.RLock()
+        self._log_lock = threading.Lock()
+        self._peer_lock = threading.Lock()
+        self.cond = threading.Condition(self._term_lock)  # Wakes the election timer
+        # Election timeouts are drawn uniformly from election_timeout_range, in seconds.
+        # A node that has heard from a leader within the lower bound refuses pre-votes.
+        self._election_timeout_min, self._election_timeout_max = election_timeout_range
+        # Seconds between AppendEntries to each follower when there is nothing to replicate
+        self.heartbeat_interval = heartbeat_interval
+        self._rand = random.Random()  # Per-node RNG; only drawn under _term_lock
+        self.election_timeout = self._new_election_timeout()
+        self.last_heartbeat = time.monotonic()
+        self._last_leader_contact = 0.0  # Last AppendEntries from a current leader
         self.leader_id = None  # Keep track of current leader
         self.votes_received = 0
+        # Term a pre-vote round is asking about, or None when no round is running
+        self._pre_vote_term = None
+        self._pre_votes_received = 0
+        # Proposed (log_index, term, entry) tuples not yet sent to followers, under _log_lock
+        self._pending_entries = []
+        self._replicate_event = threading.Event()  # Wakes the heartbeat loop early
+        self._is_leader_event = threading.Event()  # Set while the heartbeat thread should run
+        # When each peer was last sent any AppendEntries, on the monotonic clock
+        self._last_send = {peer: 0.0 for peer in self.peers}
+        # Heartbeat sent to every peer until term, log or commit index changes
+        self._hb_key = None
+        self._hb_message = None
+        # (entries, entry_terms, prev_log_index, prev_log_term, leader_id, response)
+        # awaiting the log append thread
+        self.append_queue = queue.Queue()
 
-        # Register message handlers
-        self.network_manager.register_handler('request_vote', self.handle_request_vote)
-        self.network_manager.register_handler('append_entries', self.handle_append_entries)
-        self.network_manager.register_handler('vote_response', self.handle_vote_response)
-        self.network_manager.register_handler('append_entries_response', self.handle_append_entries_response)
+        # Raft message handlers, bound to this node rather than registered on the
+        # shared NetworkManager, where the last node constructed would win
+        self._dispatch = {
+            'request_vote': self.handle_request_vote,
+            'append_entries': self.handle_append_entries,
+            'vote_response': self.handle_vote_response,
+            'append_entries_response': self.handle_append_entries_response,
+            'pre_vote': self.handle_pre_vote,
+            'pre_vote_response': self.handle_pre_vote_response,
+        }
+        # Message types whose runs are handled in one call under a single lock acquisition
+        self._batch_handlers = {
+            'append_entries': self.handle_append_entries_batch,
+            'vote_response': self.handle_vote_response_batch,
+        }
 
         # Start threads
         threading.Thread(target=self.run_election_timer, daemon=True, name=f"{self.server_id}_election_timer").start()
         threading.Thread(target=self.process_messages, daemon=True, name=f"{self.server_id}_message_processor").start()
+        threading.Thread(target=self._local_append, daemon=True, name=f"{self.server_id}_log_appender").start()
+        threading.Thread(target=self._run_heartbeats, daemon=True, name=f"{self.server_id}_heartbeats").start()
 
     def become_leader(self):
-        with self.lock:
-            self.state = 'leader'
-            self.leader_id = self.server_id
-            logging.info(f"{self.server_id}: Became leader in term {self.current_term}")
-            threading.Thread(target=self.send_heartbeats, daemon=True, name=f"{self.server_id}_heartbeats").start()
+        with self._term_lock:
+            self._become_leader_locked()
+
+    def _become_leader_locked(self):
+        # Caller holds self._term_lock
+        self.state = LEADER
+        self.leader_id = self.server_id
+        logging.info(f"{self.server_id}: Became leader in term {self.current_term}")
+        self._is_leader_event.set()
+
+    def _new_election_timeout(self) -> float:
+        # Caller holds self._term_lock, except during __init__
+        low, high = self._election_timeout_min, self._election_timeout_max
+        return low + (high - low) * self._rand.random()
 
     def run_election_timer(self):
         try:
-            while self.state != 'stopped':
-                time.sleep(0.1)
-                with self.lock:
-                    if self.state == 'leader':
-                        continue
-                    if (time.time() - self.last_heartbeat) >= self.election_timeout:
-                        logging.debug(f"{self.server_id}: Election timeout, starting election")
-                        self.start_election()
-                        self.last_heartbeat = time.time()
+            while self.state != STOPPED:
+                # Lock-free deadline check: last_heartbeat is a single float attribute
+                remaining = self.election_timeout - (time.monotonic() - self.last_heartbeat)
+                if self.state == LEADER or remaining > 0:
+                    # Heartbeats and votes notify us to re-check the deadline
+                    with self.cond:
+                        self.cond.wait(timeout=self.election_timeout if self.state == LEADER else remaining)
+                    continue
+                with self._term_lock:
+                    # A heartbeat may have arrived since the unlocked check
+                    timed_out = self.state != LEADER and (time.monotonic() - self.last_heartbeat) >= self.election_timeout
+                    if timed_out:
+                        self.last_heartbeat = time.monotonic()
+                # Sends happen with the term lock released
+                if timed_out:
+                    logging.debug(f"{self.server_id}: Election timeout, starting pre-vote")
+                    self.start_pre_vote()
         except Exception as e:
             logging.error(f"Error in run_election_timer on server '{self.server_id}': {e}")
 
-    def start_election(self):
-        with self.lock:
-            self.state = 'candidate'
+    def start_pre_vote(self):
+        # Ask whether an election for the next term could win before bumping our
+        # term, so a node that merely lost contact can't depose a healthy leader
+        with self._term_lock:
+            self._pre_vote_term = self.current_term + 1
+            self._pre_votes_received = 1
+            self.election_timeout = self._new_election_timeout()
+            term = self._pre_vote_term
+            won = self._pre_votes_received >= self._majority
+        if won:
+            # No peers to ask
+            self.start_election(term)
+            return
+
+        with self._log_lock:
+            last_log_index = self._last_log_index
+            last_log_term = self._last_log_term
+        logging.debug(f"{self.server_id}: Sending pre_vote for term {term} to {self.peers}")
+        self.network_manager.send_batch(Message('pre_vote', {
+            'term': term,
+            'candidate_id': self.server_id,
+            'last_log_index': last_log_index,
+            'last_log_term': last_log_term,
+            'source_id': self.server_id
+        }), self.peers)
+
+    def handle_pre_vote(self, data):
+        # Answer without changing any local state: no term bump, no recorded vote
+        with self._term_lock:
+            granted = (self.state != LEADER
+                       and data['term'] > self.current_term
+                       and time.monotonic() - self._last_leader_contact >= self._election_timeout_min)
+        if granted:
+            with self._log_lock:
+                # The candidate's log must be at least as up to date as ours
+                granted = (data['last_log_term'], data['last_log_index']) >= (self._last_log_term, self._last_log_index)
+        logging.debug(f"{self.server_id}: {'Granted' if granted else 'Refused'} pre_vote to {data['candidate_id']} for term {data['term']}")
+        self.network_manager.send_message(Message('pre_vote_response', {
+            'term': data['term'],
+            'vote_granted': granted,
+            'source_id': self.server_id
+        }), data['candidate_id'])
+
+    def handle_pre_vote_response(self, data):
+        with self._term_lock:
+            # Drop answers to an abandoned or superseded round
+            if self._pre_vote_term is None or data['term'] != self._pre_vote_term or self._pre_vote_term != self.current_term + 1:
+                return
+            if not data['vote_granted']:
+                return
+            self._pre_votes_received += 1
+            logging.debug(f"{self.server_id}: Received pre_vote from {data['source_id']}")
+            if self._pre_votes_received < self._majority:
+                return
+            # Close the round so later grants don't start a second election
+            term, self._pre_vote_term = self._pre_vote_term, None
+        self.start_election(term)
+
+    def start_election(self, pre_vote_term=None):
+        # pre_vote_term is the term a won pre-vote asked about; the election is
+        # abandoned if our term moved while the term lock was released
+        with self._term_lock:
+            if pre_vote_term is not None and pre_vote_term != self.current_term + 1:
+                return
+            self._pre_vote_term = None
+            self.state = CANDIDATE
             self.current_term += 1
             self.voted_for = self.server_id
             self.votes_received = 1  # Reset votes received
-            self.election_timeout = random.uniform(1, 2)  # Reset election timeout
+            self.election_timeout = self._new_election_timeout()
             logging.debug(f"{self.server_id}: Starting election for term {self.current_term}")
             logging.debug(f"{self.server_id}: Voted for self in term {self.current_term}")
+            if self.votes_received >= self._majority:
+                # Our own vote is a majority (no peers); no vote_response will come
+                self._become_leader_locked()
+                return
+            term = self.current_term
 
-        for peer in self.peers:
-            logging.debug(f"{self.server_id}: Sending request_vote to '{peer}'")
-            self.network_manager.send_message(Message('request_vote', {
-                'term': self.current_term,
-                'candidate_id': self.server_id,
-                'last_log_index': len(self.log),
-                'last_log_term': self.log[-1]['term'] if self.log else 0,
-                'source_id': self.server_id
-            }), peer)
+        with self._log_lock:
+            last_log_index = self._last_log_index
+            last_log_term = self._last_log_term
+        logging.debug(f"{self.server_id}: Sending request_vote to {self.peers}")
+        self.network_manager.send_batch(Message('request_vote', {
+            'term': term,
+            'candidate_id': self.server_id,
+            'last_log_index': last_log_index,
+            'last_log_term': last_log_term,
+            'source_id': self.server_id
+        }), self.peers)
 
     def handle_request_vote(self, data):
-        with self.lock:
-            term = data['term']
-            candidate_id = data['candidate_id']
+        term = data['term']
+        dest = data['candidate_id']
+        with self._term_lock:
+            if term > self.current_term:
+                self.current_term = term
+                self.voted_for = None
+                self.state = FOLLOWER
+                self.leader_id = None  # Unknown until the new term's leader is heard from
+                self.last_heartbeat = time.monotonic()
+                self.election_timeout = self._new_election_timeout()
+                self.cond.notify_all()
+            vote_granted = self.voted_for in [None, dest] and term >= self.current_term
+            if vote_granted:
+                self.voted_for = dest
+                logging.debug(f"{self.server_id}: Voted for {dest} in term {term}")
+            # Report the term after any update, or the candidate discards a granted
+            # vote as coming from an older term
             response = {
                 'term': self.current_term,
-                'vote_granted': False,
+                'vote_granted': vote_granted,
                 'source_id': self.server_id
             }
-            if term > self.current_term:
-                self.current_term = term
-                self.voted_for = None
-                self.state = 'follower'
-                self.last_heartbeat = time.time()
-                self.election_timeout = random.uniform(1, 2)  # Reset election timeout
-            if (self.voted_for in [None, candidate_id]) and term >= self.current_term:
-                self.voted_for = candidate_id
-                response['vote_granted'] = True
-                self.current_term = term
-                logging.debug(f"{self.server_id}: Voted for {candidate_id} in term {term}")
-            self.network_manager.send_message(Message('vote_response', response), candidate_id)
+        # Send outside the lock so the network call never extends the critical section
+        self.network_manager.send_message(Message('vote_response', response), dest)
 
     def handle_vote_response(self, data):
-        with self.lock:
-            if self.state != 'candidate':
-                return
-            term = data['term']
-            if term > self.current_term:
-                self.current_term = term
-                self.state = 'follower'
-                self.voted_for = None
-                return
-            elif term < self.current_term:
-                # Ignore old term
-                return
+        with self._term_lock:
+            self._vote_response_locked(data)
+
+    def handle_vote_response_batch(self, batch):
+        with self._term_lock:
+            for data in batch:
+                self._vote_response_locked(data)
+
+    def _vote_response_locked(self, data):
+        # Caller holds self._term_lock
+        if self.state != CANDIDATE:
+            return
+        term = data['term']
+        if term > self.current_term:
+            self.current_term = term
+            self.state = FOLLOWER
+            self.voted_for = None
+            self.leader_id = None
+            return
+        elif term < self.current_term:
+            # Ignore old term
+            return
+
+        if data['vote_granted']:
+            self.votes_received += 1
+            logging.debug(f"{self.server_id}: Received vote from {data['source_id']}")
+            if self.votes_received >= self._majority:
+                self._become_leader_locked()
 
-            if data['vote_granted']:
-                self.votes_received += 1
-                logging.debug(f"{self.server_id}: Received vote from {data['source_id']}")
-                if self.votes_received > (len(self.peers) + 1) // 2:
-                    self.state = 'leader'
-                    self.leader_id = self.server_id
-                    logging.info(f"{self.server_id}: Became leader in term {self.current_term}")
-                    threading.Thread(target=self.send_heartbeats, daemon=True, name=f"{self.server_id}_heartbeats").start()
+    def _run_heartbeats(self):
+        # One long-lived thread per node; it idles on the event between terms as leader
+        while self.state != STOPPED:
+            self._is_leader_event.wait()
+            self.send_heartbeats()
+            with self._term_lock:
+                # We may have been elected again while the loop was winding down
+                if self.state != LEADER:
+                    self._is_leader_event.clear()
 
     def send_heartbeats(self):
         try:
-            while self.state == 'leader':
-                for peer in self.peers:
-                    self.network_manager.send_message(Message('append_entries', {
-                        'term': self.current_term,
-                        'leader_id': self.server_id,
-                        'prev_log_index': len(self.log) - 1,
-                        'prev_log_term': self.log[-1]['term'] if self.log else 0,
-                        'entries': [],
-                        'leader_commit': self.commit_index
-                    }), peer)
-                time.sleep(0.5)
+            # A new leader announces itself to every peer straight away
+            self._last_send = dict.fromkeys(self.peers, 0.0)
+            with self._peer_lock:
+                # Assume followers are up to date until one rejects an AppendEntries
+                self.next_index = dict.fromkeys(self.peers, self._last_log_index)
+            with self._term_lock:
+                term = self.current_term
+                with self._log_lock:
+                    # Proposals left from an earlier term as leader may since have been
+                    # truncated from the log; only this term's are ours to send
+                    self._pending_entries = [p for p in self._pending_entries if p[1] == term]
+            while self.state == LEADER:
+                with self._log_lock:
+                    pending, self._pending_entries = self._pending_entries, []
+                if pending:
+                    # Entries proposed since the last round stand in for the heartbeat
+                    self._send_append_entries([entry for _, _, entry in pending],
+                                              [term for _, term, _ in pending], pending[0][0] - 1)
+                else:
+                    # Peers sent real entries within the interval don't need a heartbeat yet
+                    now = time.monotonic()
+                    due = [peer for peer in self.peers if now - self._last_send[peer] >= self.heartbeat_interval]
+                    if due:
+                        # One heartbeat message shared by every due peer
+                        self.network_manager.send_batch(self._heartbeat_message(), due)
+                        for peer in due:
+                            self._last_send[peer] = now
+                # Sleep until the next peer is due, or until propose() has new entries
+                next_due = min(self._last_send.values(), default=time.monotonic()) + self.heartbeat_interval
+                self._replicate_event.wait(timeout=max(0.0, next_due - time.monotonic()))
+                self._replicate_event.clear()
         except Exception as e:
             logging.error(f"Error in send_heartbeats on server '{self.server_id}': {e}")
 
+    def _heartbeat_message(self):
+        # Reuse the last heartbeat while nothing in it has changed. Peers may still
+        # hold the cached message, so a change always builds a new one.
+        key = (self.current_term, self._log_generation, self.commit_index)
+        if key != self._hb_key:
+            with self._log_lock:
+                prev_log_index = self._last_log_index - 1
+                prev_log_term = self._last_log_term
+            self._hb_message = Message('append_entries', {
+                'term': key[0],
+                'leader_id': self.server_id,
+                'prev_log_index': prev_log_index,
+                'prev_log_term': prev_log_term,
+                'entries': [],
+                'entry_terms': [],
+                'leader_commit': key[2]
+            })
+            self._hb_key = key
+        return self._hb_message
+
+    def propose(self, entry) -> bool:
+        # Append a client operation to the log and hand it to the heartbeat loop.
+        # Returns False, leaving the log untouched, when this node is not the leader.
+        with self._term_lock:
+            if self.state != LEADER:
+                return False
+            term = self.current_term
+            with self._log_lock:
+                self._append_log(term, entry)
+                self._pending_entries.append((self._last_log_index - 1, term, entry))
+        self._replicate_event.set()
+        return True
+
+    def _append_log(self, term, entry):
+        # Caller holds self._log_lock
+        self.log_terms.append(term)
+        self.log.append(entry)
+        self._last_log_index = len(self.log)
+        self._last_log_term = term
+        self._log_generation += 1
+
+    def _merge_entries(self, prev_log_index, entry_terms, entries):
+        # Caller holds self._log_lock and has checked the entry at prev_log_index.
+        # Entries we already hold are kept; the log is truncated only from the first
+        # index whose term conflicts, so a delayed duplicate can't drop newer entries.
+        index = prev_log_index + 1
+        for offset, term in enumerate(entry_terms):
+            if index + offset >= len(self.log_terms) or self.log_terms[index + offset] != term:
+                break
+        else:
+            return
+        start = index + offset
+        del self.log_terms[start:]
+        del self.log[start:]
+        self.log_terms.extend(entry_terms[offset:])
+        self.log.extend(entries[offset:])
+        self._last_log_index = len(self.log)
+        self._last_log_term = self.log_terms[-1] if self.log_terms else 0
+        self._log_generation += 1
+
+    def _send_append_entries(self, entries, entry_terms, prev_log_index):
+        # One AppendEntries per peer carrying every entry after prev_log_index
+        with self._log_lock:
+            prev_log_term = self.log_terms[prev_log_index] if prev_log_index >= 0 else 0
+        payload = {
+            'term': self.current_term,
+            'leader_id': self.server_id,
+            'prev_log_index': prev_log_index,
+            'prev_log_term': prev_log_term,
+            'entries': entries,
+            'entry_terms': entry_terms,
+            'leader_commit': self.commit_index
+        }
+        self.network_manager.send_batch(Message('append_entries', payload), self.peers)
+        now = time.monotonic()
+        for peer in self.peers:
+            self._last_send[peer] = now
+        logging.debug(f"{self.server_id}: Sent {len(entries)} log entries to followers")
+
     def handle_append_entries(self, data):
-        with self.lock:
-            term = data['term']
-            leader_id = data['leader_id']
-            if term >= self.current_term:
-                self.current_term = term
-                self.state = 'follower'
-                self.voted_for = leader_id
-                self.leader_id = leader_id
-                self.last_heartbeat = time.time()
-                self.election_timeout = random.uniform(1, 2)  # Reset election timeout
-                response = {
-                    'term': self.current_term,
-                    'success': True
-                }
-                logging.debug(f"{self.server_id}: Received heartbeat from leader {leader_id}")
-            else:
-                response = {
-                    'term': self.current_term,
-                    'success': False
-                }
-            self.network_manager.send_message(Message('append_entries_response', response), leader_id)
+        with self._term_lock:
+            item = self._append_entries_locked(data)
+        # The append thread sends the response once the entries are in the log
+        self.append_queue.put(item)
+
+    def handle_append_entries_batch(self, batch):
+        with self._term_lock:
+            items = [self._append_entries_locked(data) for data in batch]
+        for item in items:
+            self.append_queue.put(item)
+
+    def _append_entries_locked(self, data):
+        # Caller holds self._term_lock. Returns the append queue item; the response
+        # goes back to the sender even when its term is stale, so it can step down.
+        term = data['term']
+        leader_id = data['leader_id']
+        if term >= self.current_term:
+            self.current_term = term
+            self.state = FOLLOWER
+            self.voted_for = leader_id
+            self.leader_id = leader_id
+            self._pre_vote_term = None  # A live leader ends any pre-vote round
+            self.last_heartbeat = self._last_leader_contact = time.monotonic()
+            self.election_timeout = self._new_election_timeout()
+            self.cond.notify_all()
+            response = {
+                'term': self.current_term,
+                'success': True,
+                'source_id': self.server_id
+            }
+            logging.debug(f"{self.server_id}: Received heartbeat from leader {leader_id}")
+        else:
+            response = {
+                'term': self.current_term,
+                'success': False,
+                'source_id': self.server_id
+            }
+        return (data['entries'], data['entry_terms'], data['prev_log_index'], data['prev_log_term'], leader_id, response)
+
+    def _local_append(self):
+        try:
+            while True:
+                batch = [self.append_queue.get()]
+                while len(batch) < APPEND_BATCH_SIZE:
+                    try:
+                        batch.append(self.append_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                with self._log_lock:
+                    for entries, entry_terms, prev_log_index, prev_log_term, leader_id, response in batch:
+                        if not response['success']:
+                            continue
+                        if prev_log_index >= self._last_log_index or (
+                                prev_log_index >= 0 and self.log_terms[prev_log_index] != prev_log_term):
+                            # Missing or conflicting entry before this batch; the log-matching
+                            # rule only lets us append after an entry the leader also holds.
+                            # Our log length lets the leader skip straight past a gap.
+                            response['success'] = False
+                            response['last_log_index'] = self._last_log_index
+                            continue
+                        if entries:
+                            self._merge_entries(prev_log_index, entry_terms, entries)
+                            logging.debug(f"{self.server_id}: Appended {len(entries)} entries from leader {leader_id}")
+                        response['match_index'] = prev_log_index + len(entries)
+                # The log lives in memory; a persistent log would fsync once here per batch
+                for *_, leader_id, response in batch:
+                    self.network_manager.send_message(Message('append_entries_response', response), leader_id)
+        except Exception as e:
+            logging.error(f"Error in _local_append on server '{self.server_id}': {e}")
 
     def handle_append_entries_response(self, data):
-        with self.lock:
+        with self._term_lock:
             term = data['term']
             if term > self.current_term:
                 self.current_term = term
-                self.state = 'follower'
+                self.state = FOLLOWER
                 self.voted_for = None
                 self.leader_id = None
                 logging.debug(f"{self.server_id}: Stepping down to follower due to higher term {term}")
                 return
-            # Process success/failure response
-            # Update next_index and match_index if necessary
-            # For simplicity, we'll log the response
-            logging.debug(f"{self.server_id}: Received append_entries_response from follower")
+            rejected = not data['success'] and self.state == LEADER and term == self.current_term
+        peer = data['source_id']
+        # Track how far each follower's log is known to match ours
+        if data['success'] and 'match_index' in data:
+            with self._peer_lock:
+                self.match_index[peer] = max(self.match_index[peer], data['match_index'])
+                self.next_index[peer] = self.match_index[peer] + 1
+        elif rejected:
+            # The follower's log doesn't match ours at prev_log_index: back off and
+            # resend everything from an earlier point until the logs agree
+            with self._peer_lock:
+                next_index = min(self.next_index[peer] - 1, data.get('last_log_index', self.next_index[peer]))
+                self.next_index[peer] = next_index = max(next_index, 0)
+            self._send_catch_up(peer, next_index)
+        logging.debug(f"{self.server_id}: Received append_entries_response from follower")
+
+    def _send_catch_up(self, peer, next_index):
+        # Send one follower every entry from next_index on, anchored at the entry before it
+        term = self.current_term
+        with self._log_lock:
+            next_index = min(next_index, self._last_log_index)
+            prev_log_term = self.log_terms[next_index - 1] if next_index > 0 else 0
+            entries = self.log[next_index:]
+            entry_terms = self.log_terms[next_index:].tolist()
+        self.network_manager.send_message(Message('append_entries', {
+            'term': term,
+            'leader_id': self.server_id,
+            'prev_log_index': next_index - 1,
+            'prev_log_term': prev_log_term,
+            'entries': entries,
+            'entry_terms': entry_terms,
+            'leader_commit': self.commit_index
+        }), peer)
+        self._last_send[peer] = time.monotonic()
+        logging.debug(f"{self.server_id}: Sent {len(entries)} catch-up entries to {peer} from index {next_index}")
 
     def process_messages(self):
+        # Hot loop: bind the per-message lookups to locals once
+        receive = self.network_manager.receive_message
+        server_id = self.server_id
+        dispatch_run = self._dispatch_run
         try:
-            while self.state != 'stopped':
-                message = self.network_manager.receive_message(self.server_id)
-                if message:
-                    handler = self.network_manager.handlers.get(message.type)
-                    if handler:
-                        handler(message.data)
-                    else:
-                        logging.warning(f"{self.server_id}: No handler for message type '{message.type}'")
-                else:
-                    time.sleep(0.1)
+            while self.state != STOPPED:
+                batch = [receive(server_id, block=True, timeout=None)]
+                if self.state == STOPPED:
+                    # Stopped while we were blocked; drop the message unhandled
+                    batch[0].release()
+                    break
+                # Take whatever else is already waiting, up to MAX_BATCH
+                while len(batch) < MAX_BATCH:
+                    message = receive(server_id)
+                    if message is None:
+                        break
+                    batch.append(message)
+                # Dispatch consecutive runs of the same type together, keeping arrival order
+                start = 0
+                while start < len(batch):
+                    msg_type = batch[start].type
+                    end = start + 1
+                    while end < len(batch) and batch[end].type == msg_type:
+                        end += 1
+                    dispatch_run(msg_type, batch[start:end])
+                    start = end
+                for message in batch:
+                    message.release()
         except Exception as e:
             logging.error(f"Error in process_messages on server '{self.server_id}': {e}")
+
+    def _dispatch_run(self, msg_type, run):
+        batch_handler = self._batch_handlers.get(msg_type)
+        if batch_handler and len(run) > 1:
+            batch_handler([message.data for message in run])
+            return
+        handler = self._dispatch.get(msg_type)
+        if not handler:
+            logging.warning(f"{self.server_id}: No handler for message type '{msg_type}'")
+            return
+        for message in run:
+            handler(message.data)